@@ -9,296 +9,329 @@ Analyzes:
 - Market impact (price movement caused)
 - Trader classification (whale, retail, flipper, etc.)
 
+All analyses are built from one pass over the trades (see aggregate_trades),
+which main() filters to non-redemptions and sorts by timestamp exactly once.
+
 Usage:
     python3 analyze_traders.py market_data.json [--current-prob 0.95]
 """
 
+import heapq
 import json
 import sys
-from collections import defaultdict
 from datetime import datetime
 from argparse import ArgumentParser
 
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib parser is used instead
+    orjson = None
+
 
 def load_data(filepath):
-    with open(filepath) as f:
-        return json.load(f)
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
-def estimate_pnl(trades, current_prob):
+def aggregate_trades(trades):
     """
-    Estimate P&L for each trader based on their positions.
+    Accumulate every per-trader statistic in a single pass over the trades.
 
-    For YES shares: profit if prob goes up, loss if down
-    For NO shares: profit if prob goes down, loss if up
-
-    Simplified model: assumes shares bought at probBefore price
+    Expects trades sorted by timestamp with redemptions already filtered
+    out. Returns a dict of parallel columns indexed by trader in first-seen
+    order, which the analyses below turn into their result lists.
     """
-    trader_positions = defaultdict(lambda: {
-        'yes_shares': 0,
-        'no_shares': 0,
-        'yes_cost': 0,
-        'no_cost': 0,
-        'trades': []
-    })
-
-    for t in trades:
-        if t.get('is_redemption'):
-            continue
+    total_trades = len(trades)
+
+    # Divide into quartiles
+    q1_cutoff = total_trades // 4
+    q3_cutoff = (total_trades * 3) // 4
 
+    user_idx = {}
+    agg = {
+        'total_trades': total_trades,
+        'users': [],
+        'yes_shares': [],
+        'no_shares': [],
+        'yes_cost': [],
+        'no_cost': [],
+        'volume': [],
+        'trades': [],
+        'first_idx': [],
+        'early_trades': [],  # Q1
+        'mid_trades': [],    # Q2-Q3
+        'late_trades': [],   # Q4
+        'total_impact': [],
+        'biggest_move': [],
+        'flips': [],
+        'last_outcome': [],
+        'history': [],
+    }
+    users = agg['users']
+    yes_shares, no_shares = agg['yes_shares'], agg['no_shares']
+    yes_cost, no_cost = agg['yes_cost'], agg['no_cost']
+    volume, trade_count, first_idx = agg['volume'], agg['trades'], agg['first_idx']
+    early, mid, late = agg['early_trades'], agg['mid_trades'], agg['late_trades']
+    total_impact, biggest_move = agg['total_impact'], agg['biggest_move']
+    flips, last_outcome = agg['flips'], agg['last_outcome']
+    history = agg['history']
+
+    for idx, t in enumerate(trades):
+        # Read each field once; everything below works on locals
         user = t['user']
+        outcome = t['outcome']
+
+        i = user_idx.get(user)
+        if i is None:
+            i = user_idx[user] = len(users)
+            users.append(user)
+            for column in (yes_shares, no_shares, yes_cost, no_cost, volume, trade_count,
+                           early, mid, late, total_impact, biggest_move, flips):
+                column.append(0)
+            first_idx.append(idx)
+            last_outcome.append(outcome)
+            history.append([])
+
         amount = t['amount']
-        prob = t['prob_before'] / 100  # Convert to decimal
+        prob_before = t['prob_before']
+        prob = prob_before / 100  # Convert to decimal
 
         # Approximate shares purchased (simplified AMM model)
         # In reality Manifold uses a more complex CPMM
-        if t['outcome'] == 'YES':
-            shares = amount / prob if prob > 0 else 0
-            trader_positions[user]['yes_shares'] += shares
-            trader_positions[user]['yes_cost'] += amount
+        if outcome == 'YES':
+            if prob > 0:
+                yes_shares[i] += amount / prob
+            yes_cost[i] += amount
         else:
-            shares = amount / (1 - prob) if prob < 1 else 0
-            trader_positions[user]['no_shares'] += shares
-            trader_positions[user]['no_cost'] += amount
+            if prob < 1:
+                no_shares[i] += amount / (1 - prob)
+            no_cost[i] += amount
 
-        trader_positions[user]['trades'].append(t)
+        volume[i] += amount
+        trade_count[i] += 1
 
-    # Calculate estimated P&L
-    results = []
-    for user, pos in trader_positions.items():
+        if idx < q1_cutoff:
+            early[i] += 1
+        elif idx < q3_cutoff:
+            mid[i] += 1
+        else:
+            late[i] += 1
+
+        impact = abs(t['prob_after'] - prob_before)
+        total_impact[i] += impact
+        if impact > biggest_move[i]:
+            biggest_move[i] = impact
+
+        # Count position flips as they happen
+        if outcome != last_outcome[i]:
+            flips[i] += 1
+            last_outcome[i] = outcome
+
+        history[i].append((outcome, amount, prob_before))
+
+    return agg
+
+
+def top_traders(column, n, largest=True, candidates=None, ndigits=None):
+    """
+    Indices of the n traders with the largest (or smallest) values in a
+    per-trader column, ties kept in first-seen order.
+
+    With ndigits, values are ranked as displayed (rounded), so float noise
+    in accumulated sums doesn't reorder traders that show the same value.
+    """
+    if ndigits is not None:
+        column = [round(v, ndigits) for v in column]
+    if candidates is None:
+        candidates = range(len(column))
+    select = heapq.nlargest if largest else heapq.nsmallest
+    return select(n, candidates, key=column.__getitem__)
+
+
+def pnl_columns(agg, current_prob):
+    """
+    Estimate P&L for each trader based on their positions.
+
+    For YES shares: profit if prob goes up, loss if down
+    For NO shares: profit if prob goes down, loss if up
+
+    Simplified model: assumes shares bought at probBefore price
+
+    Returns per-trader columns aligned with agg['users'].
+    """
+    pnl = {'yes_value': [], 'no_value': [], 'total_cost': [], 'pnl': [], 'roi': []}
+
+    for yes_shares, no_shares, yes_cost, no_cost in zip(
+            agg['yes_shares'], agg['no_shares'], agg['yes_cost'], agg['no_cost']):
         # YES shares worth: shares * current_prob
-        yes_value = pos['yes_shares'] * current_prob
-        yes_pnl = yes_value - pos['yes_cost']
+        yes_value = yes_shares * current_prob
+        yes_pnl = yes_value - yes_cost
 
         # NO shares worth: shares * (1 - current_prob)
-        no_value = pos['no_shares'] * (1 - current_prob)
-        no_pnl = no_value - pos['no_cost']
+        no_value = no_shares * (1 - current_prob)
+        no_pnl = no_value - no_cost
 
         total_pnl = yes_pnl + no_pnl
-        total_cost = pos['yes_cost'] + pos['no_cost']
+        total_cost = yes_cost + no_cost
         roi = (total_pnl / total_cost * 100) if total_cost > 0 else 0
 
-        results.append({
-            'user': user,
-            'yes_cost': round(pos['yes_cost'], 2),
-            'no_cost': round(pos['no_cost'], 2),
-            'total_cost': round(total_cost, 2),
-            'yes_value': round(yes_value, 2),
-            'no_value': round(no_value, 2),
-            'estimated_pnl': round(total_pnl, 2),
-            'roi_pct': round(roi, 1),
-            'trade_count': len(pos['trades']),
-            'position': 'LONG' if pos['yes_cost'] > pos['no_cost'] else 'SHORT'
-        })
+        pnl['yes_value'].append(yes_value)
+        pnl['no_value'].append(no_value)
+        pnl['total_cost'].append(total_cost)
+        pnl['pnl'].append(total_pnl)
+        pnl['roi'].append(roi)
 
-    return sorted(results, key=lambda x: x['estimated_pnl'], reverse=True)
+    return pnl
 
 
-def analyze_timing(trades):
-    """Analyze when traders entered the market."""
-    if not trades:
-        return {}
+def estimate_pnl(agg, pnl, top, largest=True):
+    """P&L leaderboard: the top traders by estimated P&L (or the bottom ones)."""
+    yes_cost, no_cost = agg['yes_cost'], agg['no_cost']
 
-    # Sort by timestamp
-    sorted_trades = sorted(trades, key=lambda x: x['timestamp'])
-    total_trades = len(sorted_trades)
+    results = []
+    for i in top_traders(pnl['pnl'], top, largest, ndigits=2):
+        results.append({
+            'user': agg['users'][i],
+            'yes_cost': round(yes_cost[i], 2),
+            'no_cost': round(no_cost[i], 2),
+            'total_cost': round(pnl['total_cost'][i], 2),
+            'yes_value': round(pnl['yes_value'][i], 2),
+            'no_value': round(pnl['no_value'][i], 2),
+            'estimated_pnl': round(pnl['pnl'][i], 2),
+            'roi_pct': round(pnl['roi'][i], 1),
+            'trade_count': agg['trades'][i],
+            'position': 'LONG' if yes_cost[i] > no_cost[i] else 'SHORT'
+        })
 
-    # Divide into quartiles
-    q1_cutoff = total_trades // 4
-    q2_cutoff = total_trades // 2
-    q3_cutoff = (total_trades * 3) // 4
+    return results
 
-    trader_timing = defaultdict(lambda: {
-        'first_trade_idx': float('inf'),
-        'last_trade_idx': 0,
-        'early_trades': 0,  # Q1
-        'mid_trades': 0,    # Q2-Q3
-        'late_trades': 0,   # Q4
-        'total': 0
-    })
-
-    for idx, t in enumerate(sorted_trades):
-        if t.get('is_redemption'):
-            continue
-        user = t['user']
-        trader_timing[user]['total'] += 1
-        trader_timing[user]['first_trade_idx'] = min(trader_timing[user]['first_trade_idx'], idx)
-        trader_timing[user]['last_trade_idx'] = max(trader_timing[user]['last_trade_idx'], idx)
 
-        if idx < q1_cutoff:
-            trader_timing[user]['early_trades'] += 1
-        elif idx < q3_cutoff:
-            trader_timing[user]['mid_trades'] += 1
-        else:
-            trader_timing[user]['late_trades'] += 1
+def analyze_timing(agg, top):
+    """Analyze when traders entered the market."""
+    total_trades = agg['total_trades']
+    early, mid, late = agg['early_trades'], agg['mid_trades'], agg['late_trades']
 
     results = []
-    for user, data in trader_timing.items():
-        timing_type = 'EARLY' if data['early_trades'] > data['late_trades'] else (
-            'LATE' if data['late_trades'] > data['early_trades'] else 'SPREAD'
+    for i, user in enumerate(agg['users'][:top]):
+        timing_type = 'EARLY' if early[i] > late[i] else (
+            'LATE' if late[i] > early[i] else 'SPREAD'
         )
         results.append({
             'user': user,
             'timing_type': timing_type,
-            'first_trade_pct': round(data['first_trade_idx'] / total_trades * 100, 1),
-            'early_trades': data['early_trades'],
-            'mid_trades': data['mid_trades'],
-            'late_trades': data['late_trades'],
+            'first_trade_pct': round(agg['first_idx'][i] / total_trades * 100, 1),
+            'early_trades': early[i],
+            'mid_trades': mid[i],
+            'late_trades': late[i],
         })
 
     return results
 
 
-def analyze_position_changes(trades):
+def analyze_position_changes(agg, top):
     """Track if traders flipped their positions over time."""
-    trader_history = defaultdict(list)
-
-    for t in sorted(trades, key=lambda x: x['timestamp']):
-        if t.get('is_redemption'):
-            continue
-        trader_history[t['user']].append({
-            'outcome': t['outcome'],
-            'amount': t['amount'],
-            'date': t['date'],
-            'prob': t['prob_before']
-        })
+    histories, flips = agg['history'], agg['flips']
 
-    results = []
-    for user, history in trader_history.items():
-        if len(history) < 2:
-            continue
-
-        # Check for position flips
-        flips = 0
-        last_direction = history[0]['outcome']
-        for trade in history[1:]:
-            if trade['outcome'] != last_direction:
-                flips += 1
-                last_direction = trade['outcome']
-
-        # Calculate average entry price
-        yes_volume = sum(t['amount'] for t in history if t['outcome'] == 'YES')
-        no_volume = sum(t['amount'] for t in history if t['outcome'] == 'NO')
-
-        if yes_volume > 0:
-            avg_yes_entry = sum(t['prob'] * t['amount'] for t in history if t['outcome'] == 'YES') / yes_volume
-        else:
-            avg_yes_entry = 0
+    repeat_traders = [i for i, history in enumerate(histories) if len(history) >= 2]
 
-        if no_volume > 0:
-            avg_no_entry = sum(t['prob'] * t['amount'] for t in history if t['outcome'] == 'NO') / no_volume
-        else:
-            avg_no_entry = 0
+    results = []
+    for i in top_traders(flips, top, candidates=repeat_traders):
+        history = histories[i]
+
+        # Calculate average entry price in one pass over the history
+        yes_volume = no_volume = yes_weighted = no_weighted = 0
+        for outcome, amount, prob in history:
+            if outcome == 'YES':
+                yes_volume += amount
+                yes_weighted += prob * amount
+            elif outcome == 'NO':
+                no_volume += amount
+                no_weighted += prob * amount
+
+        avg_yes_entry = yes_weighted / yes_volume if yes_volume > 0 else 0
+        avg_no_entry = no_weighted / no_volume if no_volume > 0 else 0
 
         results.append({
-            'user': user,
+            'user': agg['users'][i],
             'trade_count': len(history),
-            'flips': flips,
-            'is_flipper': flips >= 2,
+            'flips': flips[i],
+            'is_flipper': flips[i] >= 2,
             'avg_yes_entry_prob': round(avg_yes_entry, 1),
             'avg_no_entry_prob': round(avg_no_entry, 1),
-            'first_position': history[0]['outcome'],
-            'final_position': history[-1]['outcome'],
+            'first_position': history[0][0],
+            'final_position': history[-1][0],
         })
 
-    return sorted(results, key=lambda x: x['flips'], reverse=True)
+    return results
 
 
-def analyze_market_impact(trades):
+def analyze_market_impact(agg, top):
     """Analyze how much each trader moved the market."""
-    trader_impact = defaultdict(lambda: {
-        'total_price_impact': 0,
-        'trades': 0,
-        'biggest_move': 0
-    })
-
-    for t in trades:
-        if t.get('is_redemption'):
-            continue
-
-        impact = abs(t['prob_after'] - t['prob_before'])
-        user = t['user']
-
-        trader_impact[user]['total_price_impact'] += impact
-        trader_impact[user]['trades'] += 1
-        trader_impact[user]['biggest_move'] = max(trader_impact[user]['biggest_move'], impact)
+    total_impact, trade_count = agg['total_impact'], agg['trades']
 
     results = []
-    for user, data in trader_impact.items():
-        avg_impact = data['total_price_impact'] / data['trades'] if data['trades'] > 0 else 0
+    for i in top_traders(total_impact, top, ndigits=2):
+        avg_impact = total_impact[i] / trade_count[i] if trade_count[i] > 0 else 0
         results.append({
-            'user': user,
-            'total_impact_pct': round(data['total_price_impact'], 2),
+            'user': agg['users'][i],
+            'total_impact_pct': round(total_impact[i], 2),
             'avg_impact_pct': round(avg_impact, 2),
-            'biggest_move_pct': round(data['biggest_move'], 2),
-            'trade_count': data['trades']
+            'biggest_move_pct': round(agg['biggest_move'][i], 2),
+            'trade_count': trade_count[i]
         })
 
-    return sorted(results, key=lambda x: x['total_impact_pct'], reverse=True)
+    return results
 
 
-def classify_traders(trades, pnl_data):
+def classify_traders(agg, pnl, top):
     """Classify traders into categories."""
-    # Build lookup
-    pnl_lookup = {p['user']: p for p in pnl_data}
-
-    trader_stats = defaultdict(lambda: {
-        'volume': 0,
-        'trades': 0,
-        'yes_pct': 0
-    })
-
-    for t in trades:
-        if t.get('is_redemption'):
-            continue
-        user = t['user']
-        trader_stats[user]['volume'] += t['amount']
-        trader_stats[user]['trades'] += 1
-
-    # Calculate yes percentage
-    for user in trader_stats:
-        pnl = pnl_lookup.get(user, {})
-        yes_cost = pnl.get('yes_cost', 0)
-        total = pnl.get('total_cost', 1)
-        trader_stats[user]['yes_pct'] = (yes_cost / total * 100) if total > 0 else 50
+    # Volume is summed in trade order; YES cost plus NO cost can differ from
+    # it by float noise at the cent
+    volumes, trade_count = agg['volume'], agg['trades']
 
-    # Classify
-    volumes = [s['volume'] for s in trader_stats.values()]
-    whale_threshold = sorted(volumes, reverse=True)[min(10, len(volumes)-1)] if volumes else 0
+    # Classify; whales are the top 11 by volume (heap selection, no full sort)
+    whale_threshold = heapq.nlargest(11, volumes)[-1] if volumes else 0
 
     results = []
-    for user, stats in trader_stats.items():
-        pnl = pnl_lookup.get(user, {})
+    for i in top_traders(volumes, top, ndigits=2):
+        # Thresholds apply to the rounded costs and ROI the row reports, so a
+        # displayed -30.0% is never tagged LOSER
+        total_cost = round(pnl['total_cost'][i], 2)
+        yes_pct = (round(agg['yes_cost'][i], 2) / total_cost * 100) if total_cost > 0 else 50
+        roi = round(pnl['roi'][i], 1)
 
         # Determine type
         types = []
-        if stats['volume'] >= whale_threshold:
+        if volumes[i] >= whale_threshold:
             types.append('WHALE')
-        if stats['trades'] >= 20:
+        if trade_count[i] >= 20:
             types.append('ACTIVE')
-        if stats['yes_pct'] >= 80:
+        if yes_pct >= 80:
             types.append('BULL')
-        elif stats['yes_pct'] <= 20:
+        elif yes_pct <= 20:
             types.append('BEAR')
-        if pnl.get('roi_pct', 0) > 50:
+        if roi > 50:
             types.append('WINNER')
-        elif pnl.get('roi_pct', 0) < -30:
+        elif roi < -30:
             types.append('LOSER')
 
         if not types:
             types.append('RETAIL')
 
         results.append({
-            'user': user,
+            'user': agg['users'][i],
             'types': types,
-            'volume': round(stats['volume'], 2),
-            'trades': stats['trades'],
-            'yes_pct': round(stats['yes_pct'], 1),
-            'estimated_pnl': pnl.get('estimated_pnl', 0),
-            'roi_pct': pnl.get('roi_pct', 0)
+            'volume': round(volumes[i], 2),
+            'trades': trade_count[i],
+            'yes_pct': round(yes_pct, 1),
+            'estimated_pnl': round(pnl['pnl'][i], 2),
+            'roi_pct': roi
         })
 
-    return sorted(results, key=lambda x: x['volume'], reverse=True)
+    return results
 
 
 def main():
@@ -312,7 +345,10 @@ def main():
     args = parser.parse_args()
 
     data = load_data(args.input)
-    trades = data['trades']
+    # Redemptions are payouts, not trades; none of the analyses count them
+    trades = [t for t in data['trades'] if not t.get('is_redemption')]
+    # Everything downstream relies on time order; sort the fresh list in place
+    trades.sort(key=lambda x: x['timestamp'])
 
     # Get current probability
     if args.current_prob is not None:
@@ -325,35 +361,34 @@ def main():
     print(f"Analyzing {len(trades)} trades...", file=sys.stderr)
     print(file=sys.stderr)
 
-    # Run analyses
-    pnl = estimate_pnl(trades, current_prob)
-    timing = analyze_timing(trades)
-    impact = analyze_market_impact(trades)
-    positions = analyze_position_changes(trades)
-    classifications = classify_traders(trades, pnl)
+    # Run analyses off a single pass over the time-ordered trades. Result
+    # rows are only built for the top N traders of each ranking.
+    agg = aggregate_trades(trades)
+    pnl = pnl_columns(agg, current_prob)
+    top = args.top
 
     if args.output == 'all':
         output = {
             'summary': {
                 'market': data['summary']['market_title'],
                 'current_prob': current_prob,
-                'total_traders': len(pnl),
-                'total_trades': len([t for t in trades if not t.get('is_redemption')])
+                'total_traders': len(agg['users']),
+                'total_trades': len(trades)
             },
-            'pnl_leaderboard': pnl[:args.top],
-            'biggest_losers': sorted(pnl, key=lambda x: x['estimated_pnl'])[:args.top],
-            'market_movers': impact[:args.top],
-            'position_flippers': [p for p in positions if p['is_flipper']][:args.top],
-            'trader_classifications': classifications[:args.top]
+            'pnl_leaderboard': estimate_pnl(agg, pnl, top),
+            'biggest_losers': estimate_pnl(agg, pnl, top, largest=False),
+            'market_movers': analyze_market_impact(agg, top),
+            'position_flippers': [p for p in analyze_position_changes(agg, top) if p['is_flipper']],
+            'trader_classifications': classify_traders(agg, pnl, top)
         }
     elif args.output == 'pnl':
-        output = pnl[:args.top]
+        output = estimate_pnl(agg, pnl, top)
     elif args.output == 'timing':
-        output = timing[:args.top]
+        output = analyze_timing(agg, top)
     elif args.output == 'impact':
-        output = impact[:args.top]
+        output = analyze_market_impact(agg, top)
     elif args.output == 'classify':
-        output = classifications[:args.top]
+        output = classify_traders(agg, pnl, top)
 
     print(json.dumps(output, indent=2))
 
@@ -6,54 +6,241 @@ Usage:
     python3 fetch_market_data.py --market-id tt0Uy260hp
 """
 
+import gzip
 import json
+import os
 import sys
 import time
 from datetime import datetime
-from urllib.request import urlopen, Request
+from pathlib import Path
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
 from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import Request, getproxies, proxy_bypass, urlopen
 from collections import defaultdict
 from argparse import ArgumentParser
 
-
-BASE_URL = "https://api.manifold.markets/v0"
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is used instead
+    orjson = None
 
 
-def fetch_json(url: str) -> dict | list:
-    """Fetch JSON from URL with basic error handling."""
-    req = Request(url, headers={'User-Agent': 'ManifoldAnalysis/1.0'})
+BASE_URL = "https://api.manifold.markets/v0"
+PAGE_INTERVAL = 1.0  # Seconds between paginated bet requests
+CACHE_DIR = Path.home() / '.cache' / 'manifold_bets'
+HEAD_PAGE_TTL = 60  # Seconds before the newest (head) page is refetched
+USER_INTERVAL = 0.5  # Seconds between user lookups
+USER_CACHE_PATH = Path.home() / '.cache' / 'manifold_users.json'
+REQUEST_HEADERS = {'User-Agent': 'ManifoldAnalysis/1.0', 'Accept-Encoding': 'gzip'}
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Keep-alive connections reused across requests, keyed by (scheme, host)
+_connections = {}
+
+
+def print_json(obj):
+    """Print indented JSON to stdout, using orjson when it is installed."""
+    # orjson emits raw UTF-8, so write its bytes straight to the binary
+    # stream; printing the decoded text fails on a non-UTF-8 stdout (e.g.
+    # cp1252 when redirected on Windows). Text-only stdouts such as a
+    # StringIO get the ASCII-escaped stdlib output instead.
+    buffer = getattr(sys.stdout, 'buffer', None)
+    if orjson is not None and buffer is not None:
+        sys.stdout.flush()
+        buffer.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2) + b'\n')
+        buffer.flush()
+    else:
+        print(json.dumps(obj, indent=2))
+
+
+def loads(raw: bytes):
+    """Parse JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _request(parts) -> tuple:
+    """GET a split URL over the host's keep-alive connection.
+
+    Returns the response and its (still encoded) body.
+    """
+    key = (parts.scheme, parts.netloc)
+    path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+    for attempt in range(2):
+        conn = _connections.get(key)
+        if conn is None:
+            conn_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+            conn = _connections[key] = conn_class(parts.netloc, timeout=30)
+        try:
+            conn.request('GET', path, headers=REQUEST_HEADERS)
+            resp = conn.getresponse()
+            return resp, resp.read()
+        except (HTTPException, OSError):
+            # The server may have dropped an idle keep-alive connection;
+            # reconnect and retry once
+            conn.close()
+            del _connections[key]
+            if attempt:
+                raise
+
+
+def _fetch_via_urlopen(url: str) -> dict | list:
+    """Fetch JSON through urllib, which applies the proxy configuration."""
+    req = Request(url, headers=REQUEST_HEADERS)
     try:
         with urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode())
+            body = resp.read()
+            encoding = resp.headers.get('Content-Encoding')
     except HTTPError as e:
         print(f"Error fetching {url}: {e}", file=sys.stderr)
         return None
 
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    return loads(body)
+
+
+def fetch_json(url: str) -> dict | list:
+    """Fetch JSON from URL with basic error handling.
+
+    Requests go over one persistent connection per host, so paginated
+    fetches pay the TCP/TLS handshake once, and responses are gzipped.
+    Redirects are followed. When a proxy is configured for the URL (e.g.
+    HTTPS_PROXY, minus NO_PROXY hosts), the request goes through urlopen
+    instead, which handles the proxy and redirects itself.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        if parts.scheme in getproxies() and not proxy_bypass(parts.hostname):
+            return _fetch_via_urlopen(url)
+
+        resp, body = _request(parts)
+        location = resp.getheader('Location')
+        if resp.status not in REDIRECT_STATUSES or not location:
+            break
+        url = urljoin(url, location)
+    else:
+        print(f"Error fetching {url}: too many redirects", file=sys.stderr)
+        return None
+
+    if resp.status != 200:
+        print(f"Error fetching {url}: HTTP Error {resp.status}: {resp.reason}", file=sys.stderr)
+        return None
+
+    if resp.getheader('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return loads(body)
+
+
+def load_cached_page(path: Path, ttl: float | None = None) -> list | None:
+    """Load a cached bet page, or None if missing, stale or unreadable."""
+    try:
+        if ttl is not None and time.time() - path.stat().st_mtime > ttl:
+            return None
+        with gzip.open(path, 'rb') as f:
+            return loads(f.read())
+    except (OSError, EOFError, ValueError):
+        return None
+
+
+def save_cached_page(path: Path, bets: list):
+    """Write a bet page to the cache atomically."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(json.dumps(bets).encode())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not cache {path}: {e}", file=sys.stderr)
+
+
+def has_open_limit_order(bets: list) -> bool:
+    """Whether any bet is a limit order that can still fill or be cancelled."""
+    return any(
+        b.get('limitProb') is not None and not b.get('isFilled') and not b.get('isCancelled')
+        for b in bets
+    )
 
-def fetch_all_bets(contract_id: str, limit_per_page: int = 1000) -> list:
-    """Fetch all bets for a contract with pagination."""
+
+def prune_cached_pages(directory: Path, keep: set):
+    """Delete cached bet pages in directory whose names are not in keep."""
+    try:
+        for path in directory.glob('*.json.gz'):
+            if path.name not in keep:
+                path.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Could not prune {directory}: {e}", file=sys.stderr)
+
+
+def fetch_all_bets(contract_id: str, limit_per_page: int = 1000, use_cache: bool = True) -> list:
+    """Fetch all bets for a contract with pagination.
+
+    Pages are cached on disk keyed by (contract_id, before cursor, page size).
+    Settled bets don't change, so only the newest (head) page expires, after
+    HEAD_PAGE_TTL seconds. Pages holding an open limit order are never cached,
+    since its filled amount and status still change.
+
+    Every new bet shifts the cursor chain and with it every page key, so when
+    the head page is refetched, pages the fresh chain no longer uses are
+    pruned from the contract's cache directory.
+    """
     all_bets = []
     before = None
+    last_request = None
+    cache_dir = CACHE_DIR / contract_id
+    used_pages = set()
+    head_refetched = False
+    complete = False
 
     while True:
         url = f"{BASE_URL}/bets?contractId={contract_id}&limit={limit_per_page}"
         if before:
             url += f"&before={before}"
 
-        print(f"Fetching bets... (got {len(all_bets)} so far)", file=sys.stderr)
-        bets = fetch_json(url)
+        cache_path = cache_dir / f"{before or 'head'}-{limit_per_page}.json.gz"
+        used_pages.add(cache_path.name)
+        bets = None
+        if use_cache:
+            bets = load_cached_page(cache_path, ttl=None if before else HEAD_PAGE_TTL)
+
+        if bets is None:
+            # Pace requests by start time so the time spent waiting on the
+            # previous response counts towards the interval
+            if last_request is not None:
+                wait = PAGE_INTERVAL - (time.monotonic() - last_request)
+                if wait > 0:
+                    time.sleep(wait)
+            last_request = time.monotonic()
+
+            print(f"Fetching bets... (got {len(all_bets)} so far)", file=sys.stderr)
+            bets = fetch_json(url)
+            if before is None:
+                head_refetched = True
+
+            if bets is not None and use_cache and not has_open_limit_order(bets):
+                save_cached_page(cache_path, bets)
 
         if not bets:
+            complete = bets is not None
             break
 
         all_bets.extend(bets)
 
         if len(bets) < limit_per_page:
+            complete = True
             break
 
         # Use the oldest bet's ID for pagination
         before = bets[-1]['id']
-        time.sleep(1.0)  # Be nice to the API - 1 second between pages
+
+    # Only prune after a full walk, so a failed request can't evict good pages
+    if use_cache and head_refetched and complete:
+        prune_cached_pages(cache_dir, used_pages)
 
     return all_bets
 
@@ -64,10 +251,32 @@ def fetch_user(user_id: str) -> dict:
     return fetch_json(url)
 
 
-def fetch_users_batch(user_ids: set, skip_fetch: bool = True) -> dict:
+def load_user_cache() -> dict:
+    """Load the id -> name/username map of users resolved on earlier runs."""
+    try:
+        with open(USER_CACHE_PATH, 'rb') as f:
+            return loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_user_cache(users: dict):
+    """Write the resolved user map to the cache atomically."""
+    tmp_path = USER_CACHE_PATH.with_name(USER_CACHE_PATH.name + '.tmp')
+    try:
+        USER_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps(users))
+        os.replace(tmp_path, USER_CACHE_PATH)
+    except OSError as e:
+        print(f"Could not cache {USER_CACHE_PATH}: {e}", file=sys.stderr)
+
+
+def fetch_users_batch(user_ids: set, skip_fetch: bool = True, use_cache: bool = True) -> dict:
     """Fetch multiple users and return id->name mapping.
 
     If skip_fetch=True, just use truncated IDs to avoid hammering API.
+    Otherwise users resolved on earlier runs come from USER_CACHE_PATH and
+    only the rest are looked up.
     """
     user_map = {}
 
@@ -77,22 +286,34 @@ def fetch_users_batch(user_ids: set, skip_fetch: bool = True) -> dict:
             user_map[uid] = {'name': uid[:12], 'username': uid[:12]}
         return user_map
 
-    total = len(user_ids)
+    known = load_user_cache() if use_cache else {}
+    missing = [uid for uid in user_ids if uid not in known]
+    total = len(missing)
+    last_request = None
 
-    for i, uid in enumerate(user_ids):
+    for i, uid in enumerate(missing):
         if (i + 1) % 10 == 0:
             print(f"Fetching users... {i+1}/{total}", file=sys.stderr)
 
+        # Much longer delay to be nice, paced by request start time
+        if last_request is not None:
+            wait = USER_INTERVAL - (time.monotonic() - last_request)
+            if wait > 0:
+                time.sleep(wait)
+        last_request = time.monotonic()
+
         user = fetch_user(uid)
         if user:
-            user_map[uid] = {
+            known[uid] = {
                 'name': user.get('name', 'Unknown'),
                 'username': user.get('username', uid),
             }
-        else:
-            user_map[uid] = {'name': uid[:12], 'username': uid[:12]}
 
-        time.sleep(0.5)  # Much longer delay to be nice
+    if missing and use_cache:
+        save_user_cache(known)
+
+    for uid in user_ids:
+        user_map[uid] = known.get(uid) or {'name': uid[:12], 'username': uid[:12]}
 
     return user_map
 
@@ -106,26 +327,36 @@ def fetch_market(market_id: str) -> dict:
 def process_bets(bets: list, user_map: dict) -> list:
     """Process bets into structured trade records."""
     trades = []
+    # Many bets share a calendar day; format each day's labels only once
+    day_labels = {}
 
     for bet in bets:
-        user_id = bet.get('userId', 'unknown')
-        user_info = user_map.get(user_id, {'name': user_id[:8], 'username': user_id[:8]})
+        get = bet.get  # Bound once; every field below is read through it
 
-        # Convert timestamp
-        created_time = bet.get('createdTime', 0)
-        dt = datetime.fromtimestamp(created_time / 1000)
+        user_id = get('userId', 'unknown')
+        user_info = user_map.get(user_id)
+        if user_info is None:
+            user_info = {'name': user_id[:8], 'username': user_id[:8]}
 
-        # Handle both regular bets and limit orders
-        amount = abs(bet.get('amount', 0))
-        outcome = bet.get('outcome', 'YES')
+        # Convert timestamp
+        created_time = get('createdTime', 0)
+        day = datetime.fromtimestamp(created_time / 1000).date()
+        labels = day_labels.get(day)
+        if labels is None:
+            labels = day_labels[day] = (day.strftime('%Y-%m-%d'), day.strftime('%b %Y'))
+        date_str, month_str = labels
+
+        # Handle both regular bets and limit orders; sells carry a negative amount
+        raw_amount = get('amount', 0)
+        amount = abs(raw_amount)
+        outcome = get('outcome', 'YES')
 
         # Determine action type
-        is_redemption = bet.get('isRedemption', False)
-        is_sell = amount < 0 or bet.get('isSold', False)
+        is_redemption = get('isRedemption', False)
 
         if is_redemption:
             action = 'redeemed'
-        elif bet.get('amount', 0) < 0:
+        elif raw_amount < 0:
             action = 'sold'
         else:
             action = 'bought'
@@ -135,14 +366,14 @@ def process_bets(bets: list, user_map: dict) -> list:
             'username': user_info['username'],
             'user_id': user_id,
             'action': action,
-            'amount': round(abs(bet.get('amount', 0)), 2),
+            'amount': round(amount, 2),
             'outcome': outcome,
-            'prob_before': round(bet.get('probBefore', 0) * 100, 1),
-            'prob_after': round(bet.get('probAfter', 0) * 100, 1),
-            'date': dt.strftime('%Y-%m-%d'),
-            'month': dt.strftime('%b %Y'),
+            'prob_before': round(get('probBefore', 0) * 100, 1),
+            'prob_after': round(get('probAfter', 0) * 100, 1),
+            'date': date_str,
+            'month': month_str,
             'timestamp': created_time,
-            'is_limit_order': bet.get('limitProb') is not None,
+            'is_limit_order': get('limitProb') is not None,
             'is_redemption': is_redemption,
         })
 
@@ -151,15 +382,7 @@ def process_bets(bets: list, user_map: dict) -> list:
 
 def aggregate_by_trader(trades: list) -> list:
     """Aggregate trades by trader for leaderboard."""
-    traders = defaultdict(lambda: {
-        'total_volume': 0,
-        'trade_count': 0,
-        'buys': 0,
-        'sells': 0,
-        'yes_volume': 0,
-        'no_volume': 0,
-        'username': '',
-    })
+    traders = {}
 
     for t in trades:
         if t['is_redemption']:
@@ -168,23 +391,38 @@ def aggregate_by_trader(trades: list) -> list:
         user = t['user']
         amount = t['amount']
 
-        traders[user]['username'] = t['username']
-        traders[user]['total_volume'] += amount
-        traders[user]['trade_count'] += 1
+        trader = traders.get(user)
+        if trader is None:
+            trader = traders[user] = {
+                'total_volume': 0,
+                'trade_count': 0,
+                'buys': 0,
+                'sells': 0,
+                'yes_volume': 0,
+                'no_volume': 0,
+                'username': '',
+            }
+
+        trader['username'] = t['username']
+        trader['total_volume'] += amount
+        trader['trade_count'] += 1
 
         if t['action'] == 'bought':
-            traders[user]['buys'] += 1
+            trader['buys'] += 1
         else:
-            traders[user]['sells'] += 1
+            trader['sells'] += 1
 
         if t['outcome'] == 'YES':
-            traders[user]['yes_volume'] += amount
+            trader['yes_volume'] += amount
         else:
-            traders[user]['no_volume'] += amount
+            trader['no_volume'] += amount
 
     # Convert to sorted list
     result = []
-    for name, data in sorted(traders.items(), key=lambda x: x[1]['total_volume'], reverse=True):
+    # Rank by volume with a bound-method key rather than a lambda over items
+    volumes = {name: data['total_volume'] for name, data in traders.items()}
+    for name in sorted(volumes, key=volumes.__getitem__, reverse=True):
+        data = traders[name]
         yes_pct = (data['yes_volume'] / data['total_volume'] * 100) if data['total_volume'] > 0 else 0
         result.append({
             'name': name,
@@ -203,33 +441,29 @@ def aggregate_by_trader(trades: list) -> list:
 
 def aggregate_by_month(trades: list) -> list:
     """Aggregate trades by month for time series."""
-    monthly = defaultdict(lambda: {'yes': 0, 'no': 0, 'total': 0, 'count': 0})
+    # Keyed by the 'YYYY-MM' prefix of the trade date, which sorts
+    # chronologically as a plain string
+    monthly = defaultdict(lambda: {'month': '', 'yes': 0, 'no': 0, 'total': 0, 'count': 0})
 
     for t in trades:
         if t['is_redemption']:
             continue
 
-        month = t['month']
-        monthly[month]['total'] += t['amount']
-        monthly[month]['count'] += 1
+        month = monthly[t['date'][:7]]
+        month['month'] = t['month']
+        month['total'] += t['amount']
+        month['count'] += 1
 
         if t['outcome'] == 'YES':
-            monthly[month]['yes'] += t['amount']
+            month['yes'] += t['amount']
         else:
-            monthly[month]['no'] += t['amount']
-
-    # Sort by date
-    def month_sort_key(month_str):
-        try:
-            return datetime.strptime(month_str, '%b %Y')
-        except ValueError:
-            return datetime.min
+            month['no'] += t['amount']
 
     result = []
-    for month in sorted(monthly.keys(), key=month_sort_key):
-        data = monthly[month]
+    for key in sorted(monthly):
+        data = monthly[key]
         result.append({
-            'month': month,
+            'month': data['month'],
             'yes_volume': round(data['yes'], 2),
             'no_volume': round(data['no'], 2),
             'total_volume': round(data['total'], 2),
@@ -244,6 +478,8 @@ def main():
     parser.add_argument('--market-id', '-m', required=True, help='Market ID')
     parser.add_argument('--output', '-o', default='all',
                        choices=['trades', 'traders', 'monthly', 'all', 'json'])
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Ignore and do not write the on-disk bet page cache')
     args = parser.parse_args()
 
     # Fetch market info
@@ -255,7 +491,7 @@ def main():
         sys.exit(1)
 
     # Fetch all bets
-    bets = fetch_all_bets(args.market_id)
+    bets = fetch_all_bets(args.market_id, use_cache=not args.no_cache)
     print(f"Fetched {len(bets)} bets", file=sys.stderr)
 
     if not bets:
@@ -291,13 +527,13 @@ def main():
             'monthly': monthly,
             'trades': trades if args.output == 'json' else trades[-100:],  # Last 100 for 'all'
         }
-        print(json.dumps(output, indent=2))
+        print_json(output)
     elif args.output == 'trades':
-        print(json.dumps(trades, indent=2))
+        print_json(trades)
     elif args.output == 'traders':
-        print(json.dumps(traders, indent=2))
+        print_json(traders)
     elif args.output == 'monthly':
-        print(json.dumps(monthly, indent=2))
+        print_json(monthly)
 
 
 if __name__ == '__main__':
@@ -12,67 +12,105 @@ Usage:
     python3 generate_viz.py market_data.json usernames.json -o output.html
 """
 
+import heapq
 import json
+from bisect import bisect_right
+from html import escape
 from collections import defaultdict
-from datetime import datetime
 from argparse import ArgumentParser
 
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib json module is used instead
+    orjson = None
+
 
 def load_json(filepath):
-    with open(filepath) as f:
-        return json.load(f)
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
-def estimate_pnl(trades, current_prob):
-    """Estimate P&L for each trader."""
-    trader_positions = defaultdict(lambda: {
-        'yes_shares': 0, 'no_shares': 0,
-        'yes_cost': 0, 'no_cost': 0
-    })
+def dumps(obj) -> str:
+    """Serialize to JSON for inlining in the page, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def analyze_all(trades, current_prob):
+    """
+    Aggregate monthly volume, P&L and market impact in one pass.
+
+    Returns (monthly, pnl, impact): YES/NO volume per month keyed by the
+    'YYYY-MM' date prefix (which sorts chronologically), and per-trader P&L
+    estimates and price impact keyed by user.
+    """
+    monthly = defaultdict(lambda: {'month': '', 'yes': 0, 'no': 0})
+
+    # Per-trader columns indexed by first-seen order
+    user_idx = {}
+    yes_shares, no_shares, yes_cost, no_cost = [], [], [], []
+    total_impact, biggest_move = [], []
 
     for t in trades:
         if t.get('is_redemption'):
             continue
-        user = t['user']
-        amount = t['amount']
-        prob = t['prob_before'] / 100
-
+        u = t['user']
+        a = t['amount']
+        pb = t['prob_before']
+        i = user_idx.get(u)
+        if i is None:
+            i = user_idx[u] = len(user_idx)
+            for column in (yes_shares, no_shares, yes_cost, no_cost, total_impact, biggest_move):
+                column.append(0)
+
+        month = monthly[t['date'][:7]]
+        month['month'] = t['month']
+
+        prob = pb / 100
         if t['outcome'] == 'YES':
-            shares = amount / prob if prob > 0 else 0
-            trader_positions[user]['yes_shares'] += shares
-            trader_positions[user]['yes_cost'] += amount
+            month['yes'] += a
+            if prob > 0:
+                yes_shares[i] += a / prob
+            yes_cost[i] += a
         else:
-            shares = amount / (1 - prob) if prob < 1 else 0
-            trader_positions[user]['no_shares'] += shares
-            trader_positions[user]['no_cost'] += amount
-
-    results = {}
-    for user, pos in trader_positions.items():
-        yes_value = pos['yes_shares'] * current_prob
-        no_value = pos['no_shares'] * (1 - current_prob)
-        total_cost = pos['yes_cost'] + pos['no_cost']
-        total_pnl = (yes_value - pos['yes_cost']) + (no_value - pos['no_cost'])
+            month['no'] += a
+            if prob < 1:
+                no_shares[i] += a / (1 - prob)
+            no_cost[i] += a
+
+        move = abs(t['prob_after'] - pb)
+        total_impact[i] += move
+        if move > biggest_move[i]:
+            biggest_move[i] = move
+
+    pnl = {}
+    impact = {}
+    for user, i in user_idx.items():
+        yes_value = yes_shares[i] * current_prob
+        no_value = no_shares[i] * (1 - current_prob)
+        total_cost = yes_cost[i] + no_cost[i]
+        total_pnl = (yes_value - yes_cost[i]) + (no_value - no_cost[i])
         roi = (total_pnl / total_cost * 100) if total_cost > 0 else 0
 
-        results[user] = {
+        pnl[user] = {
             'pnl': round(total_pnl, 0),
             'roi': round(roi, 1),
             'cost': round(total_cost, 0)
         }
-    return results
+        impact[user] = {'total': round(total_impact[i], 1), 'biggest': round(biggest_move[i], 1)}
 
+    return monthly, pnl, impact
 
-def analyze_market_impact(trades):
-    """Calculate price impact per trader."""
-    impact = defaultdict(lambda: {'total': 0, 'biggest': 0})
-    for t in trades:
-        if t.get('is_redemption'):
-            continue
-        move = abs(t['prob_after'] - t['prob_before'])
-        impact[t['user']]['total'] += move
-        impact[t['user']]['biggest'] = max(impact[t['user']]['biggest'], move)
-    return {u: {'total': round(d['total'], 1), 'biggest': round(d['biggest'], 1)}
-            for u, d in impact.items()}
+
+# Read-only fallbacks for traders missing from the lookups, shared so the
+# leaderboard loop doesn't build a fresh default dict per row
+_NO_USER = {}
+_NO_PNL = {'pnl': 0, 'roi': 0, 'cost': 0}
+_NO_IMPACT = {'total': 0, 'biggest': 0}
 
 
 def classify_trader(volume, trades, yes_pct, roi, whale_threshold):
@@ -93,88 +131,20 @@ def classify_trader(volume, trades, yes_pct, roi, whale_threshold):
     return types if types else ['RETAIL']
 
 
-def fmt_vol(v):
-    if v >= 1000000:
-        return f"Ṁ{v/1000000:.2f}M"
-    if v >= 1000:
-        return f"Ṁ{v/1000:.1f}k"
-    return f"Ṁ{v:.0f}"
-
-
-def generate_html(data, users, output_path, url_slug=None):
-    """Generate the HTML visualization."""
-    trades = data['trades']
-    s = data['summary']
-    current_prob = s.get('current_probability', 50) / 100
-
-    # Calculate cumulative monthly data
-    monthly = defaultdict(lambda: {'yes': 0, 'no': 0})
-    for t in trades:
-        if t.get('is_redemption'):
-            continue
-        month = t['month']
-        if t['outcome'] == 'YES':
-            monthly[month]['yes'] += t['amount']
-        else:
-            monthly[month]['no'] += t['amount']
+# (divisor, suffix, decimals) for plain, thousands and millions, picked by
+# bisecting the band thresholds
+_VOL_THRESHOLDS = (1000, 1000000)
+_VOL_BANDS = ((1, '', 0), (1000, 'k', 1), (1000000, 'M', 2))
 
-    def month_sort_key(m):
-        try:
-            return datetime.strptime(m, '%b %Y')
-        except:
-            return datetime.min
 
-    months = sorted(monthly.keys(), key=month_sort_key)
-    cumulative = []
-    yes_cum, no_cum = 0, 0
-    for m in months:
-        yes_cum += monthly[m]['yes']
-        no_cum += monthly[m]['no']
-        cumulative.append({'month': m, 'YES': round(yes_cum), 'NO': round(no_cum)})
-
-    # Run analyses
-    pnl_data = estimate_pnl(trades, current_prob)
-    impact_data = analyze_market_impact(trades)
-
-    # Build trader list
-    volumes = [t['total_volume'] for t in data['traders']]
-    whale_threshold = sorted(volumes, reverse=True)[min(9, len(volumes)-1)] if volumes else 0
-
-    traders_enhanced = []
-    for t in data['traders'][:25]:
-        u = users.get(t['username'], {})
-        username = u.get('username', t['username'][:12])
-        pnl = pnl_data.get(t['username'], {'pnl': 0, 'roi': 0, 'cost': 0})
-        impact = impact_data.get(t['username'], {'total': 0, 'biggest': 0})
-
-        types = classify_trader(
-            t['total_volume'], t['trade_count'], t['yes_pct'],
-            pnl['roi'], whale_threshold
-        )
-
-        traders_enhanced.append({
-            'name': f"@{username}",
-            'volume': round(t['total_volume']),
-            'trades': t['trade_count'],
-            'yesPct': round(t['yes_pct'], 1),
-            'yes': round(t['yes_volume']),
-            'no': round(t['no_volume']),
-            'pnl': pnl['pnl'],
-            'roi': pnl['roi'],
-            'impact': impact['total'],
-            'types': types
-        })
-
-    total_yes = round(sum(t['yes_volume'] for t in data['traders']))
-    total_no = round(sum(t['no_volume'] for t in data['traders']))
-    yes_pct = round(total_yes / (total_yes + total_no) * 100, 1) if (total_yes + total_no) > 0 else 0
+def fmt_vol(v):
+    divisor, suffix, decimals = _VOL_BANDS[bisect_right(_VOL_THRESHOLDS, v)]
+    return f"Ṁ{v / divisor:.{decimals}f}{suffix}"
 
-    title = s['market_title']
-    if not url_slug:
-        url_slug = "market"
 
-    # Generate HTML
-    html = f'''<!DOCTYPE html>
+# Page skeleton, filled in by generate_html via str.format_map; literal CSS/JS
+# braces are doubled
+_HTML_TEMPLATE = '''<!DOCTYPE html>
 <html lang="en">
 <head>
   <meta charset="UTF-8">
@@ -230,17 +200,17 @@ def generate_html(data, users, output_path, url_slug=None):
     <h1>{title}</h1>
     <p class="subtitle"><a href="https://manifold.markets/{url_slug}" target="_blank">manifold.markets/{url_slug}</a></p>
     <div class="stats-grid">
-      <div class="stat-card"><div class="stat-label"><span>🎯</span> Probability</div><div class="stat-value">{s["current_probability"]:.0f}%</div></div>
-      <div class="stat-card"><div class="stat-label"><span>📊</span> Volume</div><div class="stat-value">{fmt_vol(s["total_volume"])}</div></div>
-      <div class="stat-card"><div class="stat-label"><span>🔄</span> Trades</div><div class="stat-value">{s["total_trades"]:,}</div></div>
-      <div class="stat-card"><div class="stat-label"><span>👥</span> Traders</div><div class="stat-value">{s["unique_traders"]:,}</div></div>
+      <div class="stat-card"><div class="stat-label"><span>🎯</span> Probability</div><div class="stat-value">{probability:.0f}%</div></div>
+      <div class="stat-card"><div class="stat-label"><span>📊</span> Volume</div><div class="stat-value">{volume}</div></div>
+      <div class="stat-card"><div class="stat-label"><span>🔄</span> Trades</div><div class="stat-value">{total_trades:,}</div></div>
+      <div class="stat-card"><div class="stat-label"><span>👥</span> Traders</div><div class="stat-value">{unique_traders:,}</div></div>
     </div>
     <div class="chart-container">
       <h2 class="chart-title">Cumulative Volume Over Time <span>(Stacked by Position)</span></h2>
       <div style="position: relative; height: 350px; width: 100%;"><canvas id="volumeChart"></canvas></div>
       <div class="legend">
-        <div class="legend-item"><div class="legend-dot" style="background: #10b981;"></div><span style="color:#94a3b8">YES</span><span class="yes-vol">{fmt_vol(total_yes)} ({yes_pct}%)</span></div>
-        <div class="legend-item"><div class="legend-dot" style="background: #ef4444;"></div><span style="color:#94a3b8">NO</span><span class="no-vol">{fmt_vol(total_no)} ({100-yes_pct:.1f}%)</span></div>
+        <div class="legend-item"><div class="legend-dot" style="background: #10b981;"></div><span style="color:#94a3b8">YES</span><span class="yes-vol">{yes_volume} ({yes_pct}%)</span></div>
+        <div class="legend-item"><div class="legend-dot" style="background: #ef4444;"></div><span style="color:#94a3b8">NO</span><span class="no-vol">{no_volume} ({no_pct:.1f}%)</span></div>
       </div>
     </div>
     <div class="chart-container">
@@ -259,8 +229,8 @@ def generate_html(data, users, output_path, url_slug=None):
     <div class="footer">Data from Manifold Markets API • Enhanced analysis • Generated <span id="date"></span></div>
   </div>
   <script>
-    const dailyData = {json.dumps(cumulative)};
-    const traders = {json.dumps(traders_enhanced)};
+    const dailyData = {cumulative_json};
+    const traders = {traders_json};
     function fmt(v) {{ if (v >= 1000000) return `Ṁ${{(v/1000000).toFixed(2)}}M`; if (v >= 1000) return `Ṁ${{(v/1000).toFixed(1)}}k`; return `Ṁ${{Math.round(v)}}`; }}
     const ctx = document.getElementById('volumeChart').getContext('2d');
     new Chart(ctx, {{
@@ -274,12 +244,11 @@ def generate_html(data, users, output_path, url_slug=None):
         scales: {{ x: {{ grid: {{ color: '#334155' }}, ticks: {{ color: '#94a3b8' }} }}, y: {{ stacked: true, grid: {{ color: '#334155' }}, ticks: {{ color: '#94a3b8', callback: v => fmt(v) }} }} }}
       }}
     }});
-    const tb = document.getElementById('traderTable');
-    traders.forEach((t, i) => {{
+    document.getElementById('traderTable').innerHTML = traders.map((t, i) => {{
       const badges = t.types.map(type => `<span class="badge ${{type.toLowerCase()}}">${{type}}</span>`).join('');
       const pnlClass = t.pnl >= 0 ? 'pnl-pos' : 'pnl-neg';
       const pnlSign = t.pnl >= 0 ? '+' : '';
-      tb.innerHTML += `<tr>
+      return `<tr>
         <td class="${{i<3?'rank gold':'rank'}}">${{i===0?'🥇':i===1?'🥈':i===2?'🥉':i+1}}</td>
         <td class="trader-name">${{t.name}}</td>
         <td>${{badges}}</td>
@@ -291,12 +260,91 @@ def generate_html(data, users, output_path, url_slug=None):
         <td class="right ${{pnlClass}}">${{pnlSign}}${{t.roi.toFixed(0)}}%</td>
         <td class="right" style="color:#94a3b8">${{t.impact.toFixed(1)}}%</td>
       </tr>`;
-    }});
+    }}).join('');
     document.getElementById('date').textContent = new Date().toLocaleDateString();
   </script>
 </body>
 </html>'''
 
+
+def generate_html(data, users, output_path, url_slug=None, top=25):
+    """Generate the HTML visualization with a leaderboard of the top traders."""
+    trades = data['trades']
+    s = data['summary']
+    current_prob = s.get('current_probability', 50) / 100
+
+    # Monthly volume, P&L and impact all come from one pass over the trades
+    monthly, pnl_data, impact_data = analyze_all(trades, current_prob)
+
+    cumulative = []
+    yes_cum, no_cum = 0, 0
+    for key in sorted(monthly):
+        m = monthly[key]
+        yes_cum += m['yes']
+        no_cum += m['no']
+        cumulative.append({'month': m['month'], 'YES': round(yes_cum), 'NO': round(no_cum)})
+
+    # Build trader list. The overall YES/NO split is summed in the same scan
+    # from the trader aggregates, which cover every trade; data['trades'] may
+    # be truncated (fetch_market_data --output all keeps only the last 100)
+    volumes = []
+    yes_sum = no_sum = 0
+    for t in data['traders']:
+        volumes.append(t['total_volume'])
+        yes_sum += t['yes_volume']
+        no_sum += t['no_volume']
+    whale_threshold = heapq.nlargest(10, volumes)[-1] if volumes else 0  # 10th largest
+
+    traders_enhanced = []
+    for t in data['traders'][:top]:
+        user = t['username']
+        u = users.get(user, _NO_USER)
+        username = u.get('username', user[:12])
+        pnl = pnl_data.get(user, _NO_PNL)
+        impact = impact_data.get(user, _NO_IMPACT)
+
+        types = classify_trader(
+            t['total_volume'], t['trade_count'], t['yes_pct'],
+            pnl['roi'], whale_threshold
+        )
+
+        traders_enhanced.append({
+            'name': f"@{username}",
+            'volume': round(t['total_volume']),
+            'trades': t['trade_count'],
+            'yesPct': round(t['yes_pct'], 1),
+            'yes': round(t['yes_volume']),
+            'no': round(t['no_volume']),
+            'pnl': pnl['pnl'],
+            'roi': pnl['roi'],
+            'impact': impact['total'],
+            'types': types
+        })
+
+    total_yes = round(yes_sum)
+    total_no = round(no_sum)
+    yes_pct = round(total_yes / (total_yes + total_no) * 100, 1) if (total_yes + total_no) > 0 else 0
+
+    title = s['market_title']
+    if not url_slug:
+        url_slug = "market"
+
+    # Generate HTML
+    html = _HTML_TEMPLATE.format_map({
+        'title': escape(title),
+        'url_slug': escape(url_slug),
+        'probability': s['current_probability'],
+        'volume': fmt_vol(s['total_volume']),
+        'total_trades': s['total_trades'],
+        'unique_traders': s['unique_traders'],
+        'yes_volume': fmt_vol(total_yes),
+        'yes_pct': yes_pct,
+        'no_volume': fmt_vol(total_no),
+        'no_pct': 100 - yes_pct,
+        'cumulative_json': dumps(cumulative),
+        'traders_json': dumps(traders_enhanced),
+    })
+
     with open(output_path, 'w') as f:
         f.write(html)
     print(f"Created {output_path}")
@@ -308,11 +356,12 @@ def main():
     parser.add_argument('usernames', help='Resolved usernames JSON file')
     parser.add_argument('-o', '--output', required=True, help='Output HTML file')
     parser.add_argument('--url', help='URL slug for market link')
+    parser.add_argument('--top', '-n', type=int, default=25, help='Traders shown in the leaderboard')
     args = parser.parse_args()
 
     data = load_json(args.data)
     users = load_json(args.usernames)
-    generate_html(data, users, args.output, args.url)
+    generate_html(data, users, args.output, args.url, args.top)
 
 
 if __name__ == '__main__':
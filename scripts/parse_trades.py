@@ -10,6 +10,7 @@ Usage:
     python3 parse_trades.py trades.txt --reference-date 2025-01-11
 """
 
+import heapq
 import sys
 import json
 import re
@@ -17,30 +18,60 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 from argparse import ArgumentParser
 
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder is used instead
+    orjson = None
+
+
+# Relative times like "23d", "3mo" (or "3m"), "1y"; one match yields count and unit
+_TIME_RE = re.compile(r'(\d+)(mo?|d|y)')
+_UNIT_DAYS = {'d': 1, 'm': 30, 'mo': 30, 'y': 365}
+
+# Natural language: "JoshYou bought Ṁ350 of >$25B YES"
+_NL_RE = re.compile(r'(\w+)\s+(bought|sold)\s+[ṀM]?(\d+)\s+(?:of\s+)?(.+?)\s+(YES|NO)', re.IGNORECASE)
+
+
+def print_json(obj):
+    """Print indented JSON to stdout, using orjson when it is installed."""
+    # orjson emits raw UTF-8, so write its bytes straight to the binary
+    # stream; printing the decoded text fails on a non-UTF-8 stdout (e.g.
+    # cp1252 when redirected on Windows). Text-only stdouts such as a
+    # StringIO get the ASCII-escaped stdlib output instead.
+    buffer = getattr(sys.stdout, 'buffer', None)
+    if orjson is not None and buffer is not None:
+        sys.stdout.flush()
+        buffer.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2) + b'\n')
+        buffer.flush()
+    else:
+        print(json.dumps(obj, indent=2))
+
 
 def parse_time_ago(time_str: str, reference_date: datetime) -> datetime:
     """Convert relative time string to approximate date."""
     time_str = time_str.strip().lower()
     
-    # Parse days: "23d", "5d"
-    if match := re.match(r'(\d+)d', time_str):
-        days = int(match.group(1))
-        return reference_date - timedelta(days=days)
-    
-    # Parse months: "1mo", "3mo", "11mo"
-    if match := re.match(r'(\d+)mo?', time_str):
-        months = int(match.group(1))
-        return reference_date - timedelta(days=months * 30)
-    
-    # Parse years: "1y", "2y"
-    if match := re.match(r'(\d+)y', time_str):
-        years = int(match.group(1))
-        return reference_date - timedelta(days=years * 365)
+    if match := _TIME_RE.match(time_str):
+        count, unit = match.groups()
+        return reference_date - timedelta(days=int(count) * _UNIT_DAYS[unit])
     
     # Default to reference date if unparseable
     return reference_date
 
 
+_date_label_cache = {}
+
+
+def _date_labels(time_str: str, reference_date: datetime) -> tuple[str, str]:
+    """Return the (date, month) labels for a relative time, formatting each distinct value once."""
+    key = (time_str, reference_date)
+    labels = _date_label_cache.get(key)
+    if labels is None:
+        trade_date = parse_time_ago(time_str, reference_date)
+        labels = _date_label_cache[key] = (trade_date.strftime('%Y-%m-%d'), trade_date.strftime('%b %Y'))
+    return labels
+
+
 def parse_trade_line(line: str, reference_date: datetime) -> dict | None:
     """Parse a single trade line into structured data."""
     line = line.strip()
@@ -52,24 +83,25 @@ def parse_trade_line(line: str, reference_date: datetime) -> dict | None:
     if len(parts) >= 6:
         user, action, amount, answer, outcome, time_ago = parts[:6]
         try:
-            trade_date = parse_time_ago(time_ago, reference_date)
+            time_ago = time_ago.strip()
+            date, month = _date_labels(time_ago, reference_date)
             return {
                 'user': user.strip(),
                 'action': action.strip().lower(),
                 'amount': int(amount.strip()),
                 'answer': answer.strip(),
                 'outcome': outcome.strip().upper(),
-                'time_ago': time_ago.strip(),
-                'date': trade_date.strftime('%Y-%m-%d'),
-                'month': trade_date.strftime('%b %Y')
+                'time_ago': time_ago,
+                'date': date,
+                'month': month
             }
         except (ValueError, AttributeError):
             pass
     
     # Try natural language: "JoshYou bought Ṁ350 of >$25B YES"
-    pattern = r'(\w+)\s+(bought|sold)\s+[ṀM]?(\d+)\s+(?:of\s+)?(.+?)\s+(YES|NO)'
-    if match := re.match(pattern, line, re.IGNORECASE):
+    if match := _NL_RE.match(line):
         user, action, amount, answer, outcome = match.groups()
+        date, month = _date_labels('', reference_date)
         return {
             'user': user,
             'action': action.lower(),
@@ -77,48 +109,65 @@ def parse_trade_line(line: str, reference_date: datetime) -> dict | None:
             'answer': answer.strip(),
             'outcome': outcome.upper(),
             'time_ago': 'unknown',
-            'date': reference_date.strftime('%Y-%m-%d'),
-            'month': reference_date.strftime('%b %Y')
+            'date': date,
+            'month': month
         }
     
     return None
 
 
+def parse_lines(lines, reference_date: datetime) -> list:
+    """Parse an iterable of trade lines (e.g. an open file), skipping unparseable ones."""
+    trades = []
+    for line in lines:
+        if trade := parse_trade_line(line, reference_date):
+            trades.append(trade)
+    return trades
+
+
 def aggregate_by_trader(trades: list) -> list:
     """Aggregate trades by trader for leaderboard."""
-    traders = defaultdict(lambda: {
-        'total_volume': 0,
-        'trade_count': 0,
-        'buys': 0,
-        'sells': 0,
-        'yes_volume': 0,
-        'no_volume': 0,
-        'answers': defaultdict(float)
-    })
+    traders = {}
     
     for t in trades:
         user = t['user']
         amount = t['amount']
         
-        traders[user]['total_volume'] += amount
-        traders[user]['trade_count'] += 1
+        trader = traders.get(user)
+        if trader is None:
+            trader = traders[user] = {
+                'total_volume': 0,
+                'trade_count': 0,
+                'buys': 0,
+                'sells': 0,
+                'yes_volume': 0,
+                'no_volume': 0,
+                'answers': defaultdict(float)
+            }
+        
+        trader['total_volume'] += amount
+        trader['trade_count'] += 1
         
         if t['action'] == 'bought':
-            traders[user]['buys'] += 1
+            trader['buys'] += 1
         else:
-            traders[user]['sells'] += 1
+            trader['sells'] += 1
         
         if t['outcome'] == 'YES':
-            traders[user]['yes_volume'] += amount
+            trader['yes_volume'] += amount
         else:
-            traders[user]['no_volume'] += amount
+            trader['no_volume'] += amount
         
-        traders[user]['answers'][t['answer']] += amount
+        trader['answers'][t['answer']] += amount
     
     # Convert to sorted list
     result = []
-    for name, data in sorted(traders.items(), key=lambda x: x[1]['total_volume'], reverse=True):
-        top_answers = sorted(data['answers'].items(), key=lambda x: x[1], reverse=True)[:3]
+    # Rank by volume with a bound-method key rather than a lambda over items
+    volumes = {name: data['total_volume'] for name, data in traders.items()}
+    for name in sorted(volumes, key=volumes.__getitem__, reverse=True):
+        data = traders[name]
+        answers = data['answers']
+        top_answers = [(a, answers[a]) for a in heapq.nlargest(3, answers, key=answers.__getitem__)]
         result.append({
             'name': name,
             'total_volume': data['total_volume'],
@@ -135,22 +184,20 @@ def aggregate_by_trader(trades: list) -> list:
 
 def aggregate_by_month(trades: list) -> list:
     """Aggregate trades by month and answer for time series."""
+    # Keyed by the 'YYYY-MM' date prefix, which sorts chronologically
     monthly = defaultdict(lambda: defaultdict(float))
+    labels = {}
     
     for t in trades:
-        monthly[t['month']][t['answer']] += t['amount']
+        key = t['date'][:7]
+        labels[key] = t['month']
+        monthly[key][t['answer']] += t['amount']
     
     # Sort by date and convert to list
-    def month_sort_key(month_str):
-        try:
-            return datetime.strptime(month_str, '%b %Y')
-        except ValueError:
-            return datetime.min
-    
     result = []
-    for month in sorted(monthly.keys(), key=month_sort_key):
-        entry = {'month': month}
-        entry.update(monthly[month])
+    for key in sorted(monthly):
+        entry = {'month': labels[key]}
+        entry.update(monthly[key])
         result.append(entry)
     
     return result
@@ -171,18 +218,12 @@ def main():
     else:
         reference_date = datetime.now()
     
-    # Read input
+    # Parse trades line by line as the input is read
     if args.input:
         with open(args.input) as f:
-            lines = f.readlines()
+            trades = parse_lines(f, reference_date)
     else:
-        lines = sys.stdin.readlines()
-    
-    # Parse trades
-    trades = []
-    for line in lines:
-        if trade := parse_trade_line(line, reference_date):
-            trades.append(trade)
+        trades = parse_lines(sys.stdin, reference_date)
     
     # Generate output
     if args.output == 'trades':
@@ -204,7 +245,7 @@ def main():
             }
         }
     
-    print(json.dumps(output, indent=2))
+    print_json(output)
 
 
 if __name__ == '__main__':